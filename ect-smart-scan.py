@@ -18,6 +18,7 @@ import libtiepie as ltp
 import matplotlib.pyplot as plt
 import numpy as np
 import scan as sc
+import scipy.fft
 import sys
 import time
 import trajectory as traj
@@ -51,59 +52,69 @@ if __name__ == "__main__":
             stage.move([settings["trajectory"]["init_x"], settings["trajectory"]["init_y"]], velocity=10, mode="abs", wait_until_idle=True)
             
             # Get trajectory set up.
-            x_list = [settings["trajectory"]["coords"][i][0] for i in range(len(settings["trajectory"]["coords"]))]
-            y_list = [settings["trajectory"]["coords"][i][1] for i in range(len(settings["trajectory"]["coords"]))]
+            coords = np.asarray(settings["trajectory"]["coords"], dtype=float)
+            x_list, y_list = coords[:, 0], coords[:, 1]
             # If speed is a single value, replicate it to the same size as x_list and y_list.
             if isinstance(settings["trajectory"]["v"], float):
-                v_list = [settings["trajectory"]["v"] for i in range(len(x_list))]
-            # If speed is a list of values, check how long it is.
+                v_list = np.full(coords.shape[0], settings["trajectory"]["v"])
+            # If speed is a list of values, cycle through it until we have the
+            # right length. If it is too long, only take up to the right length.
             elif isinstance(settings["trajectory"]["v"], list):
-                # If list of speeds is too small, cycle through it until we have the right length.
-                if len(settings["trajectory"]["v"]) < len(x_list):
-                    v_list = [settings["trajectory"]["v"][i%len(settings["trajectory"]["v"])] for i in range(len(x_list))]
-                # If list of speeds too large, only take up to the right length.
-                else:
-                    v_list = settings["trajectory"]["v"][:len(x_list)]
+                if len(settings["trajectory"]["v"]) == 0:
+                    raise ValueError("Velocity list should not be empty.")
+                v_list = np.resize(np.asarray(settings["trajectory"]["v"], dtype=float), coords.shape[0])
             # We must have an invalid data type.
             else:
                 raise TypeError("Velocity should be a list of floats or a float.")
+            # Each row is one step of the trajectory: (x, y, v).
+            trajectory = np.column_stack([x_list, y_list, v_list])
             
-            # Initialise output array so that if live plotting requested, there is an initial value for RMS.
-            out_data = None
-            t1 = time.time_ns() * 1e-9
+            # Work out what kind of analysis we want, and which scan to call
+            # for it, once before the scan starts.
+            analysis = settings["trajectory"]["analysis"].lower()
+            if analysis == "rms":
+                scan_fn, scan_kwargs = sc.linear_scan_rms, {}
+            elif analysis == "spec":
+                # Frequency bins are the same for every record, so work out
+                # which ones we want once rather than for every segment.
+                freq   = scipy.fft.rfftfreq(handyscope.scp.record_length, 1/handyscope.scp.sample_frequency)
+                f_idxs = h.freq_idxs(freq, settings["generator"]["signal"]["frequency"])
+                scan_fn, scan_kwargs = sc.linear_scan_spec, {"freq":freq, "f_idxs":f_idxs}
+            else:
+                raise NotImplementedError("Analysis type must be 'RMS' or 'Spec'.")
+            
+            # Initialise output storage. Each segment of the trajectory is kept
+            # separately and joined once the scan has finished, rather than
+            # growing one array (and copying it) on every segment.
+            x_chunks   = [None] * trajectory.shape[0]
+            y_chunks   = [None] * trajectory.shape[0]
+            out_chunks = [None] * trajectory.shape[0]
+            t1 = time.perf_counter()
             #%% Actually perform the scan
-            for idx, (x, y, v) in enumerate(zip(x_list, y_list, v_list)):
-                # Work out what kind of analysis we want, and call the right one.
-                if settings["trajectory"]["analysis"].lower() == "rms":
-                    x_scan, y_scan, out_scan = sc.linear_scan_rms(handyscope, stage, [x, y], velocity=v)#, live_plot=True, old_val=out_data)
-                elif settings["trajectory"]["analysis"].lower() == "spec":
-                    x_scan, y_scan, out_scan = sc.linear_scan_spec(handyscope, stage, [x, y], velocity=v)#, live_plot=True, freq_range=[8.5e6, 14e6])
-                else:
-                    raise NotImplementedError("Analysis type must be 'RMS' or 'Spec'.")
-                # Initialise output arrays
-                if idx == 0:
-                    x_data = x_scan
-                    y_data = y_scan
-                    out_data = out_scan
-                # Append data
-                else:
-                    x_data   = np.append(x_data, x_scan)
-                    y_data   = np.append(y_data, y_scan)
-                    out_data = np.append(out_data, np.asarray(out_scan), axis=0)
-            t2 = time.time_ns() * 1e-9
+            for idx in range(trajectory.shape[0]):
+                # For live plotting, also pass live_plot=True, with
+                # old_val=out_chunks[idx-1] for RMS or freq_range=[8.5e6, 14e6]
+                # for spec.
+                x_scan, y_scan, out_scan = scan_fn(handyscope, stage, trajectory[idx, :2], velocity=trajectory[idx, 2], **scan_kwargs)
+                # Store data
+                x_chunks[idx]   = x_scan
+                y_chunks[idx]   = y_scan
+                out_chunks[idx] = out_scan
+            x_data   = np.concatenate(x_chunks)
+            y_data   = np.concatenate(y_chunks)
+            out_data = np.concatenate(out_chunks, axis=0)
+            t2 = time.perf_counter()
             print("Total scan time: {:.2f}s".format(t2-t1))
             
             #%% Output the data: #TODO Check that this plotting still works. It should do, but idxs may need adjusting
-            if settings["trajectory"]["analysis"].lower() == "rms":
+            if analysis == "rms":
                 h.plot_data(r"output\{}".format(settings["job"]["name"]), x_data, y_data, out_data)
                 h.save_csv(r"output\{}".format(settings["job"]["name"]), x_data, y_data, out_data)
                 
-            elif settings["trajectory"]["analysis"].lower() == "spec":
-                freq = np.fft.rfftfreq(handyscope.scp.record_length, 1/handyscope.scp.sample_frequency)
-                export_data = np.empty((out_data.shape[0], len(settings["generator"]["signal"]["frequency"])), dtype=out_data.dtype)
-                # Only do the frequencies which we have multiplexed.
-                for idx, f in enumerate(settings["generator"]["signal"]["frequency"]):
-                    f_idx = np.argmin(np.abs(freq - f))
-                    export_data[:, idx] = out_data[:, f_idx]
-                    h.plot_data(r"output\{}".format(settings["job"]["name"]), x_data, x_data, out_data[:, f_idx], zlabel="Frequency Spectrum at {:.1f}MHz".format(f*10**-6))
+            elif analysis == "spec":
+                # Only the frequencies which we have multiplexed were kept
+                # during the scan.
+                export_data = out_data
+                for idx, f in enumerate(np.atleast_1d(settings["generator"]["signal"]["frequency"])):
+                    h.plot_data(r"output\{}".format(settings["job"]["name"]), x_data, y_data, export_data[:, idx], zlabel="Frequency Spectrum at {:.1f}MHz".format(f*10**-6))
                 h.save_csv(r"output\{}".format(settings["job"]["name"]), x_data, y_data, export_data, zlabel="spec ", zaxis=settings["generator"]["signal"]["frequency"])
\ No newline at end of file
@@ -37,8 +37,10 @@ class Handyscope:
     
     def __init__(self, input_frequency, input_amplitude, output_sample_frequency, output_record_length, output_range, input_signal_type=ltp.ST_SINE, input_offset=0, output_measure_mode=ltp.MM_BLOCK, output_resolution=12, output_active_channels=-1, output_channel_coupling=ltp.CK_ACV):
         ltp.device_list.update()
-        self.gen = ltp.device_list.get_item_by_index(find_gen(ltp.device_list)).open_generator()
-        self.scp = ltp.device_list.get_item_by_index(find_scp(ltp.device_list)).open_oscilloscope()
+        _, self.gen = find_gen(ltp.device_list)
+        _, self.scp = find_scp(ltp.device_list)
+        if self.gen is None or self.scp is None:
+            raise RuntimeError("Handyscope cannot be found! Connect it and make sure drivers are installed.")
         
         #%% Initialise oscilloscope. We'll probably need sample_frequency for 
         # everything, so start with the scope.
@@ -148,7 +150,9 @@ class Handyscope:
                     ch.coupling = kwargs[kw]
     
     def get_record(self, channels=[-1]):
-        """ Do all the data collection, so initialisation required outside. """
+        """ Do all the data collection, so initialisation required outside.
+        Data is measured to 16 bits at most, so it is returned in single
+        precision to halve the memory used by any analysis downstream. """
         self.scp.start()
         self.gen.start()
         
@@ -161,7 +165,7 @@ class Handyscope:
         
         # Return all active channels.
         if channels[0] == -1:
-            np_data = np.empty((sum(self.scp._active_channels), self.scp.record_length))
+            np_data = np.empty((sum(self.scp._active_channels), self.scp.record_length), dtype=np.float32)
             idx = 0
             for ch, active in enumerate(self.scp._active_channels):
                 if active:
@@ -170,10 +174,10 @@ class Handyscope:
             return np_data
         # Return the requested channels, even if inactive.
         else:
-            np_data = np.empty((len(channels), self.scp.record_length))
+            np_data = np.empty((len(channels), self.scp.record_length), dtype=np.float32)
             for idx, ch in enumerate(channels):
                 if self.scp._active_channels[ch]:
                     np_data[idx, :] = np.asarray(data[ch])
                 else:
                     np_data[idx, :] = np.zeros((self.scp.record_length))
-            return np.asarray(data)
\ No newline at end of file
+            return np_data
\ No newline at end of file
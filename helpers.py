@@ -9,78 +9,110 @@ any other file. Should consist of short, easily read functions, rather than
 anything too much more extensive.
 """
 import csv
+from functools import lru_cache
+import glob
 import libtiepie as ltp
 import matplotlib.pyplot as plt
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 import numpy as np
 import os
+import re
 from serial.tools.list_ports import comports
 from zaber_motion import Units
 import yaml
 
+# Equivalent units of velocity for each of the units of length.
+vel_units_dict = {Units.LENGTH_METRES:Units.VELOCITY_METRES_PER_SECOND,
+                  Units.LENGTH_CENTIMETRES:Units.VELOCITY_CENTIMETRES_PER_SECOND,
+                  Units.LENGTH_MILLIMETRES:Units.VELOCITY_MILLIMETRES_PER_SECOND,
+                  Units.LENGTH_MICROMETRES:Units.VELOCITY_MICROMETRES_PER_SECOND,
+                  Units.LENGTH_NANOMETRES:Units.VELOCITY_NANOMETRES_PER_SECOND,
+                  Units.LENGTH_INCHES:Units.VELOCITY_INCHES_PER_SECOND}
+
+# Figure last drawn by plot_data(), so that it can be reused when plotting
+# different data at the same points. Deliberately only one figure is cached per
+# process: drawing different points closes it and replaces it.
+_plot_cache = {}
+
+@lru_cache()
 def get_port(manufacturer="FTDI"):
     """
     Returns the port which the device of interest is connected to. Serial does
-    not guarantee that comports() returns ports in order, thus we sort by port.
-    It is assumed that only one connection is available, thus the first one is
-    returned; if none available then RuntimeError raised.
-    """
-    ports = sorted(comports(), key=lambda port: port.device)
-    for port in ports:
-        if port.manufacturer == manufacturer:
-            return port.device
+    not guarantee that comports() returns ports in order, thus we take the
+    lowest port. It is assumed that only one connection is available, thus the
+    first one is returned; if none available then RuntimeError raised. Listing
+    the ports is slow, so the result is cached for future calls.
+    """
+    ports = [port.device for port in comports() if port.manufacturer == manufacturer]
+    if ports:
+        return min(ports)
     raise RuntimeError("Device cannot be found! Connect it and make sure drivers are installed.")
 
 def velocity_units(length_units):
     """
     Returns the equivalent units of velocity for the supplied length units.
     """
-    if length_units == Units.LENGTH_METRES:
-        return Units.VELOCITY_METRES_PER_SECOND
-    elif length_units == Units.LENGTH_CENTIMETRES:
-        return Units.VELOCITY_CENTIMETRES_PER_SECOND
-    elif length_units == Units.LENGTH_MILLIMETRES:
-        return Units.VELOCITY_MILLIMETRES_PER_SECOND
-    elif length_units == Units.LENGTH_MICROMETRES:
-        return Units.VELOCITY_MICROMETRES_PER_SECOND
-    elif length_units == Units.LENGTH_NANOMETRES:
-        return Units.VELOCITY_NANOMETRES_PER_SECOND
-    elif length_units == Units.LENGTH_INCHES:
-        return Units.VELOCITY_INCHES_PER_SECOND
-    else:
+    try:
+        return vel_units_dict[length_units]
+    except KeyError:
         raise TypeError("Length units are invalid")
 
 def find_gen(device_list):
     """
     Returns the index of the item in device_list which corresponds to a
-    generator.
+    generator, along with the generator itself. The generator has to be opened
+    to check what it supports, so it is passed out rather than being opened
+    again by the caller. If none found, (None, None) is returned.
     """
     for idx, item in enumerate(device_list):
         if item.can_open(ltp.DEVICETYPE_GENERATOR):
             gen = item.open_generator()
-            if gen.signal_types and ltp.ST_ARBITRARY:
-                # del gen
-                return idx
-    return None
+            if gen.signal_types & ltp.ST_ARBITRARY:
+                return idx, gen
+            # Close the generator if we are not going to use it.
+            del gen
+    return None, None
 
 def find_scp(device_list):
     """
     Returns the index of the item in device_list which corresponds to a
-    oscilloscope.
+    oscilloscope, along with the oscilloscope itself. The oscilloscope has to
+    be opened to check what it supports, so it is passed out rather than being
+    opened again by the caller. If none found, (None, None) is returned.
     """
     for idx, item in enumerate(device_list):
         if item.can_open(ltp.DEVICETYPE_OSCILLOSCOPE):
             scp = item.open_oscilloscope()
-            if scp.measure_modes and ltp.MM_BLOCK:
-                # del scp
-                return idx
-    return None
+            if scp.measure_modes & ltp.MM_BLOCK:
+                return idx, scp
+            # Close the oscilloscope if we are not going to use it.
+            del scp
+    return None, None
 
 def rms(x):
     """
-    Compute the root-mean-square of a numpy vector.
+    Compute the root-mean-square of a numpy vector. Done with a dot product so
+    that the squared values are summed in a single pass, without storing them
+    in a temporary array first.
     """
-    return np.sqrt(np.mean(np.asarray(x)**2))
+    x = np.ravel(np.asarray(x))
+    return np.sqrt(np.dot(x, x) / x.size)
+
+def freq_idxs(freq, frequencies):
+    """
+    Returns the indices of the bins in freq which are nearest to each of the
+    requested frequencies. freq must be sorted in increasing order (as returned
+    by rfftfreq), so the bins can be found by bisection rather than searching
+    the whole of freq for each frequency.
+    """
+    frequencies = np.atleast_1d(np.asarray(frequencies, dtype=float))
+    # Bin to the right of each frequency, kept in range so that both neighbours
+    # exist.
+    idxs = np.clip(np.searchsorted(freq, frequencies), 1, len(freq) - 1)
+    # Step back to the left neighbour if it is closer (or equally close, as
+    # np.argmin would do).
+    idxs -= (frequencies - freq[idxs - 1]) <= (freq[idxs] - frequencies)
+    return idxs
 
 def read_settings(filename):
     """
@@ -131,30 +163,53 @@ def dict_merge(dict1, dict2):
     from dict2 are merged into dict1, taking dict2's value over dict1's in
     conflicts.
     """
-    for k, v in dict2.items():
-        # Typical dictionary-merging behaviour is to overwrite the values in
-        # dict1 with those in dict2. If the value is a dictionary, the entire
-        # thing is overwritten rather than just duplicate terms. To preserve
-        # values in dict1[k] which are not present in dict2[k], recursively
-        # call dict_merge when we find a dictionary.
-        if (k in dict1 and isinstance(dict1[k], dict) and isinstance(dict2[k], dict)):
-            dict_merge(dict1[k], dict2[k])
-        # Either we do not have a dictionary, or this item is not a dictionary
-        # in dict1, thus we want to overwrite it anyway.
-        else:
-            dict1[k] = dict2[k]
+    # Pairs of (sub-)dictionaries still to be merged.
+    stack = [(dict1, dict2)]
+    while stack:
+        d1, d2 = stack.pop()
+        for k, v in d2.items():
+            # Typical dictionary-merging behaviour is to overwrite the values
+            # in d1 with those in d2. If the value is a dictionary, the entire
+            # thing is overwritten rather than just duplicate terms. To
+            # preserve values in d1[k] which are not present in v, merge the
+            # two sub-dictionaries later on when we find a dictionary.
+            if (k in d1 and isinstance(d1[k], dict) and isinstance(v, dict)):
+                stack.append((d1[k], v))
+            # Either we do not have a dictionary, or this item is not a
+            # dictionary in d1, thus we want to overwrite it anyway.
+            else:
+                d1[k] = v
+
+def new_filename(filename, ext):
+    """
+    Returns a filename which will not overwrite an existing file. If
+    filename+ext already exists, " (idx)" is appended to it, with idx one more
+    than the largest already in use.
+    """
+    if not os.path.isfile(f"{filename}{ext}"):
+        return filename
+    # Read the directory once, rather than checking each index in turn.
+    pattern = re.compile(r" \((\d+)\)" + re.escape(ext) + "$")
+    matches = (pattern.search(f) for f in glob.glob(f"{glob.escape(filename)} (*){ext}"))
+    idxs = [int(m.group(1)) for m in matches if m]
+    return filename + f" ({max(idxs, default=0) + 1})"
 
 def save_csv(filename, x, y, z, xunits="mm", yunits="mm", zlabel="RMS Voltage (V)", zaxis=None, ignore_long_z_warning=False):
     """
     Saves a csv of data.
     """
-    x, y, z = np.squeeze(x), np.squeeze(y), np.squeeze(z).reshape(z.shape[0], -1)
+    x, y = np.squeeze(x), np.squeeze(y)
+    # One row of z per point, however many columns it has. Reshaping to the
+    # length of x is a view where possible, and does not rely on the shape of
+    # z before any squeezing.
+    z = np.asarray(z).reshape(x.shape[0], -1)
     zlabel = np.asarray(zlabel)
     # Only check 0th dim of z as it may be 2D.
     if x.shape != y.shape and y.shape[0] != z.shape[0]:
         raise ValueError("x, y and z should all have broadcastable shapes.")
     
     if z.shape[1] != 1:
+        zaxis = np.atleast_1d(zaxis)
         if z.shape[1] != zaxis.shape[0]:
             raise ValueError("1st dim of z and zaxis must have the same shape.")
         if z.shape[1] > 10 and not ignore_long_z_warning:
@@ -162,18 +217,17 @@ def save_csv(filename, x, y, z, xunits="mm", yunits="mm", zlabel="RMS Voltage (V
         zlabel = np.char.add(zlabel, zaxis.astype(str))
         
     # Check if the file already exists.
-    if os.path.isfile(f"{filename}.csv"):
-        idx = 1
-        while os.path.isfile(f"{filename} ({idx}).csv"):
-            idx += 1
-        filename += f" ({idx})"
+    filename = new_filename(filename, ".csv")
     
     print(f"Saving {filename}.csv ...")
     with open(f"{filename}.csv", 'w', newline='') as csvfile:
         csvwriter = csv.writer(csvfile)
         csvwriter.writerow([f"x ({xunits})", f"y ({yunits})"] + ["{}".format(label) for label in zlabel])
-        for idx in range(x.shape[0]):
-            csvwriter.writerow([x[idx], y[idx]] + list(z[idx, :]))
+        # Format everything as strings in one go and let csv write every row,
+        # rather than building a list of numpy scalars for each row in turn.
+        # astype(str) keeps the shortest repr of the stored precision, as
+        # str() does, so single-precision data is not padded with extra digits.
+        csvwriter.writerows(zip(x.astype(str).tolist(), y.astype(str).tolist(), *z.T.astype(str).tolist()))
             
 def plot_data(filename, x, y, z, xunits="mm", yunits="mm", zlabel="RMS Voltage (V)"):
     """
@@ -186,22 +240,40 @@ def plot_data(filename, x, y, z, xunits="mm", yunits="mm", zlabel="RMS Voltage (
         raise ValueError("x, y and z should all have broadcastable shapes.")
         
     # Check if the file already exists.
-    if os.path.isfile(f"{filename}.png"):
-        idx = 1
-        while os.path.isfile(f"{filename} ({idx}).png"):
-            idx += 1
-        filename += f" ({idx})"
+    filename = new_filename(filename, ".png")
     
     # For plotting, if complex do absolute
-    if z.dtype == complex:
+    if np.iscomplexobj(z):
         z = np.abs(z)
-    fig = plt.figure(figsize=(8,6), dpi=100)
-    ax = fig.add_axes([0.1, 0.1, 0.6, 0.8], projection='3d')
-    graph = ax.scatter(x, y, z, c=z)
+    # If the last figure was of the same points, only update the values rather
+    # than building the whole figure again.
+    if _plot_cache and np.array_equal(_plot_cache["x"], x) and np.array_equal(_plot_cache["y"], y):
+        fig, ax, graph, cbar = _plot_cache["fig"], _plot_cache["ax"], _plot_cache["graph"], _plot_cache["cbar"]
+        graph._offsets3d = (x, y, z)
+        graph.set_array(z)
+        graph.autoscale()
+        cbar.update_normal(graph)
+        # Rescale z as a new figure would: ignore NaN and inf values, and give
+        # constant z a small range around its value.
+        zfinite = z[np.isfinite(z)]
+        zmin, zmax = (np.min(zfinite), np.max(zfinite)) if zfinite.size else (0, 0)
+        if zmin == zmax:
+            pad = .05 * abs(zmin) if zmin != 0 else .05
+            zmin, zmax = zmin - pad, zmax + pad
+        ax.set_zlim(zmin, zmax)
+    else:
+        if _plot_cache:
+            plt.close(_plot_cache["fig"])
+        fig = plt.figure(figsize=(8,6), dpi=100)
+        ax = fig.add_axes([0.1, 0.1, 0.6, 0.8], projection='3d')
+        graph = ax.scatter(x, y, z, c=z)
+        ax2 = fig.add_subplot(111)
+        ax2.set_axis_off()
+        cbar = fig.colorbar(graph, ax=ax2)
+        _plot_cache.update(x=x, y=y, fig=fig, ax=ax, graph=graph, cbar=cbar)
     ax.set_xlabel(f"x ({xunits})")
     ax.set_ylabel(f"y ({yunits})")
     ax.set_zlabel(zlabel)
-    ax2 = fig.add_subplot(111)
-    ax2.set_axis_off()
-    fig.colorbar(graph, ax=ax2, label=zlabel)
-    plt.savefig(f"{filename}.png")
\ No newline at end of file
+    cbar.set_label(zlabel)
+    fig.canvas.draw_idle()
+    fig.savefig(f"{filename}.png")
\ No newline at end of file
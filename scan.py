@@ -10,6 +10,7 @@ A file containing functions which combine the zaber stage and the handyscope.
 import helpers as h
 import matplotlib.pyplot as plt
 import numpy as np
+import scipy.fft
 import time
 # import trajectory as traj
 from zaber_motion import Units
@@ -17,7 +18,7 @@ from zaber_motion import Units
 def linear_scan_rms(handyscope, stage, target, length_units=Units.LENGTH_MILLIMETRES, velocity=1, velocity_units=Units.VELOCITY_MILLIMETRES_PER_SECOND, move_mode="abs", live_plot=False, old_val=None):
     """ 
     Collect RMS data from handyscope while stages move the substrate in a 
-    line.
+    line. Positions and RMS values are returned as numpy arrays.
     """
     # Initialise storage
     x   = []
@@ -47,25 +48,32 @@ def linear_scan_rms(handyscope, stage, target, length_units=Units.LENGTH_MILLIME
         
     return np.asarray(x), np.asarray(y), np.asarray(rms)
 
-def linear_scan_spec(handyscope, stage, target, length_units=Units.LENGTH_MILLIMETRES, velocity=1, velocity_units=Units.VELOCITY_MILLIMETRES_PER_SECOND, move_mode="abs", live_plot=False, freq_range=None):
+def linear_scan_spec(handyscope, stage, target, length_units=Units.LENGTH_MILLIMETRES, velocity=1, velocity_units=Units.VELOCITY_MILLIMETRES_PER_SECOND, move_mode="abs", live_plot=False, freq_range=None, freq=None, f_idxs=None):
     """
     Collect spectral data from handyscope while stages move the subtrate. Note
     that frequency is not passed out - the user must compute this themselves.
+    If freq is supplied it is used rather than recomputed on every call. If
+    f_idxs is supplied, only those bins of the spectrum are kept. Positions
+    and spectra are returned as numpy arrays.
     """
     # Initialise storage
     x    = []
     y    = []
     spec = []
-    freq = np.fft.rfftfreq(handyscope.scp.record_length, 1/handyscope.scp.sample_frequency)
+    if freq is None:
+        freq = scipy.fft.rfftfreq(handyscope.scp.record_length, 1/handyscope.scp.sample_frequency)
+    if f_idxs is None:
+        f_idxs = slice(None)
     # Start moving the stage
     stage.move(target, length_units=Units.LENGTH_MILLIMETRES, velocity=velocity, velocity_units=Units.VELOCITY_MILLIMETRES_PER_SECOND, mode=move_mode, wait_until_idle=False)
     
     if live_plot and freq_range is not None:
-        f1 = np.argmin(np.abs(freq - freq_range[0]))
-        f2 = np.argmin(np.abs(freq - freq_range[1]))
+        f1, f2 = h.freq_idxs(freq, freq_range)
     # Collect the data
     while abs(target[0] - stage.axis2.get_position(Units.LENGTH_MILLIMETRES)) > stage.mm_resolution or abs(target[1] - stage.axis1.get_position(Units.LENGTH_MILLIMETRES)) > stage.mm_resolution:
-        spec.append(np.fft.rfft(handyscope.get_record()[0, :]))
+        # Record is not used again, so let scipy overwrite it, and use all cores.
+        record_spec = scipy.fft.rfft(handyscope.get_record()[0, :], overwrite_x=True, workers=-1)
+        spec.append(record_spec[f_idxs])
         x.append(stage.axis2.get_position(Units.LENGTH_MILLIMETRES))
         y.append(stage.axis1.get_position(Units.LENGTH_MILLIMETRES))
         # Only collect 100 times per second - #TODO will need tweaking depending on velocity.
@@ -73,12 +81,15 @@ def linear_scan_spec(handyscope, stage, target, length_units=Units.LENGTH_MILLIM
         if live_plot:
             fig = plt.figure(figsize=(12,5),dpi=100)
             ax1 = fig.add_subplot(111)
-            ax1.plot(freq*1e-6, np.abs(spec[-1]))
+            ax1.plot(freq*1e-6, np.abs(record_spec))
             if freq_range is not None:
                 ax2 = fig.add_axes([.35, .25, .525, .6])
-                ax2.plot(freq[f1:f2]*1e-6, np.abs(spec[-1][f1:f2]))
+                ax2.plot(freq[f1:f2]*1e-6, np.abs(record_spec[f1:f2]))
             plt.show(block=False)
         else:
             time.sleep(.01)
     
-    return x, y, spec
\ No newline at end of file
+    # Gather the spectra into one (record, bin) array. Reshape rather than
+    # stack so that a segment with no records still has the right width.
+    spec = np.asarray(spec).reshape(-1, freq[f_idxs].size)
+    return np.asarray(x), np.asarray(y), spec
\ No newline at end of file